@@ -12,7 +12,7 @@ sys.path.append(os.path.dirname(__file__))
 # Import functions from other modules
 try:
     from step1_font_analysis import detect_all_font_sizes
-    from step2_font_selection import find_paragraphs_with_font
+    from step2_font_selection import find_paragraphs_with_font, index_paragraph_fonts
     from step3_chapter_selection import create_chapter_boundaries
     from step4_citation_processing import (
         create_chapter_document,
@@ -26,6 +26,55 @@ except ImportError as e:
     st.info("Make sure all step files are in the same directory as app.py")
     st.stop()
 
+@st.cache_resource(show_spinner=False, max_entries=1)
+def load_document(file_bytes):
+    """Parsed upload, shared across reruns; callers must not modify it"""
+    doc = Document(BytesIO(file_bytes))
+    return doc, doc.paragraphs
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def analyze_fonts(file_bytes, _doc, _paragraphs):
+    """Font size analysis, cached on the uploaded bytes"""
+    return detect_all_font_sizes(_doc, _paragraphs)
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def index_fonts(file_bytes, _doc, _paragraphs):
+    """Per-paragraph font sizes for the upload; callers must not modify it"""
+    return index_paragraph_fonts(_doc, _paragraphs)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def find_chapter_candidates(file_bytes, _doc, _paragraphs, font_size):
+    """Chapter candidates for a font size, cached on the uploaded bytes"""
+    font_index = index_fonts(file_bytes, _doc, _paragraphs)
+    return find_paragraphs_with_font(_doc, font_size, font_index=font_index)
+
+@st.cache_data(show_spinner=False, max_entries=1)
+def build_processed_document(file_bytes, _doc, _paragraphs, boundaries, citation_format, delete_notes):
+    """Process and rejoin all chapters, cached on the uploaded bytes and options"""
+    chapter_docs = []
+    chapter_stats = []
+    
+    # Created in here so cache hits replay the per-chapter progress
+    chapter_progress = st.progress(0)
+    
+    for i, (start, end, title) in enumerate(boundaries):
+        chapter_progress.progress((i + 1) / len(boundaries))
+        
+        chapter_doc = create_chapter_document(_doc, start, end, _paragraphs)
+        refs_found, citations_replaced = process_chapter_citations(
+            chapter_doc, citation_format, delete_notes
+        )
+        chapter_docs.append(chapter_doc)
+        chapter_stats.append((title, refs_found, citations_replaced))
+        
+        st.write(f"✅ **{title}**: {refs_found} references, {citations_replaced} citations replaced")
+    
+    final_doc = rejoin_chapters_with_formatting(chapter_docs)
+    
+    bio = BytesIO()
+    final_doc.save(bio)
+    return bio.getvalue(), chapter_stats
+
 # Sidebar for navigation
 st.sidebar.title("📚 DOCX Citation Processor")
 mode = st.sidebar.radio("Choose Mode:", ["🚀 Auto Process", "📋 Step by Step"])
@@ -36,7 +85,8 @@ st.markdown("### Transform numbered citations to full inline references")
 uploaded = st.file_uploader("Upload your DOCX file", type=["docx"])
 
 if uploaded:
-    doc = Document(uploaded)
+    file_bytes = uploaded.getvalue()
+    doc, paragraphs = load_document(file_bytes)
     
     if mode == "🚀 Auto Process":
         st.header("🚀 Automated Processing")
@@ -66,7 +116,7 @@ if uploaded:
             status.text("📊 Step 1: Analyzing font sizes...")
             progress_bar.progress(0.2)
             
-            font_sizes, font_examples = detect_all_font_sizes(doc)
+            font_sizes, font_examples = analyze_fonts(file_bytes, doc, paragraphs)
             
             if not font_sizes:
                 st.error("No font sizes detected in document!")
@@ -84,7 +134,7 @@ if uploaded:
             status.text("🔍 Step 2: Finding chapters...")
             progress_bar.progress(0.4)
             
-            chapters = find_paragraphs_with_font(doc, selected_font)
+            chapters = find_chapter_candidates(file_bytes, doc, paragraphs, selected_font)
             
             if not chapters:
                 st.warning(f"No chapters found with font size {selected_font}pt. Processing as single document.")
@@ -96,46 +146,25 @@ if uploaded:
             status.text("📋 Step 3: Creating chapter boundaries...")
             progress_bar.progress(0.6)
             
-            boundaries = create_chapter_boundaries(chapters, len(doc.paragraphs))
+            boundaries = create_chapter_boundaries(chapters, len(paragraphs))
             
-            # Step 4: Process each chapter
-            status.text("⚙️ Step 4: Processing citations...")
+            # Steps 4-5: Process each chapter and rejoin (cached per input)
+            status.text("⚙️ Step 4: Processing citations and rejoining chapters...")
             progress_bar.progress(0.8)
             
-            chapter_docs = []
+            output_bytes, chapter_stats = build_processed_document(
+                file_bytes, doc, paragraphs, boundaries, citation_format, delete_notes
+            )
+            
             total_refs = 0
             total_replacements = 0
             
-            chapter_progress = st.progress(0)
-            
-            for i, (start, end, title) in enumerate(boundaries):
-                chapter_progress.progress((i + 1) / len(boundaries))
-                
-                # Create chapter document
-                chapter_doc = create_chapter_document(doc, start, end)
-                
-                # Process citations
-                refs_found, citations_replaced = process_chapter_citations(
-                    chapter_doc, citation_format, delete_notes
-                )
-                
-                chapter_docs.append(chapter_doc)
+            for title, refs_found, citations_replaced in chapter_stats:
                 total_refs += refs_found
                 total_replacements += citations_replaced
-                
-                st.write(f"✅ **{title}**: {refs_found} references, {citations_replaced} citations replaced")
             
-            # Step 5: Rejoin chapters
-            status.text("🔗 Step 5: Rejoining chapters...")
             progress_bar.progress(1.0)
             
-            final_doc = rejoin_chapters_with_formatting(chapter_docs)
-            
-            # Create download
-            bio = BytesIO()
-            final_doc.save(bio)
-            bio.seek(0)
-            
             status.text("✅ Processing complete!")
             
             # Results
@@ -152,7 +181,7 @@ if uploaded:
             # Download button
             st.download_button(
                 "📥 Download Processed Document",
-                data=bio.getvalue(),
+                data=output_bytes,
                 file_name="document_processed.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
@@ -167,7 +196,7 @@ if uploaded:
         # Step 1: Font Analysis
         with st.expander("📊 Step 1: Font Analysis", expanded=True):
             if st.button("🔍 Analyze Font Sizes"):
-                font_sizes, font_examples = detect_all_font_sizes(doc)
+                font_sizes, font_examples = analyze_fonts(file_bytes, doc, paragraphs)
                 st.session_state.step_data['font_analysis'] = {
                     'font_sizes': dict(font_sizes),
                     'font_examples': dict(font_examples)
@@ -216,7 +245,7 @@ if uploaded:
                 )
                 
                 if st.button("🔍 Find Chapters"):
-                    chapters = find_paragraphs_with_font(doc, selected_font)
+                    chapters = find_chapter_candidates(file_bytes, doc, paragraphs, selected_font)
                     st.session_state.step_data['chapters'] = {
                         'font_size': selected_font,
                         'candidates': chapters
@@ -243,7 +272,7 @@ if uploaded:
                 
                 if selected_indices and st.button("✅ Confirm Selection"):
                     selected_chapters = [chapters[i] for i in selected_indices]
-                    boundaries = create_chapter_boundaries(selected_chapters, len(doc.paragraphs))
+                    boundaries = create_chapter_boundaries(selected_chapters, len(paragraphs))
                     
                     st.session_state.step_data['boundaries'] = boundaries
                     
@@ -267,7 +296,7 @@ if uploaded:
                     total_replacements = 0
                     
                     for start, end, title in boundaries:
-                        chapter_doc = create_chapter_document(doc, start, end)
+                        chapter_doc = create_chapter_document(doc, start, end, paragraphs)
                         refs, citations = process_chapter_citations(chapter_doc, fmt, delete_notes)
                         chapter_docs.append(chapter_doc)
                         total_refs += refs
@@ -3,7 +3,18 @@ from docx import Document
 from docx.oxml.ns import qn
 from collections import Counter, defaultdict
 
-def detect_all_font_sizes(doc):
+def style_font_size_for(para, style_fonts, cache):
+    """Font size of the paragraph's style, looked up once per style id"""
+    style_id = para._p.style
+    if style_id not in cache:
+        cache[style_id] = None
+        try:
+            cache[style_id] = style_fonts.get(para.style.name)
+        except:
+            pass
+    return cache[style_id]
+
+def detect_all_font_sizes(doc, paragraphs=None):
     """Detect all font sizes in the document"""
     font_sizes = Counter()
     font_examples = defaultdict(list)
@@ -17,47 +28,40 @@ def detect_all_font_sizes(doc):
         except:
             pass
     
+    style_cache = {}
+    
+    if paragraphs is None:
+        paragraphs = doc.paragraphs
+    
     # Check each paragraph
-    for i, para in enumerate(doc.paragraphs):
+    for i, para in enumerate(paragraphs):
         text = para.text.strip()
         if not text:
             continue
         
         # Get style font size
-        style_font_size = None
-        try:
-            style_name = para.style.name
-            style_font_size = style_fonts.get(style_name)
-        except:
-            pass
+        style_font_size = style_font_size_for(para, style_fonts, style_cache)
         
-        # Check runs
-        para_font_sizes = []
+        # Check runs, keeping only the largest size seen
+        max_font = None
         for run in para.runs:
             font_size = style_font_size  # Default to style
             
-            # Check run font size
-            try:
-                if run.font.size:
-                    font_size = run.font.size.pt
-            except:
-                pass
-            
-            # Check XML
+            # Check run font size (w:sz is in half-points)
             try:
-                if run.element.rPr is not None:
-                    sz = run.element.rPr.find(qn('w:sz'))
+                rPr = run.element.rPr
+                if rPr is not None:
+                    sz = rPr.find(qn('w:sz'))
                     if sz is not None:
                         font_size = float(sz.get(qn('w:val'))) / 2
             except:
                 pass
             
-            if font_size:
-                para_font_sizes.append(font_size)
+            if font_size and (max_font is None or font_size > max_font):
+                max_font = font_size
         
         # Use largest font in paragraph
-        if para_font_sizes:
-            max_font = max(para_font_sizes)
+        if max_font:
             font_sizes[max_font] += 1
             
             # Store examples
@@ -1,10 +1,18 @@
 import streamlit as st
 from docx import Document
-from docx.oxml.ns import qn
+from docx.oxml.ns import nsmap
+from lxml import etree
+from collections import defaultdict
+from step1_font_analysis import style_font_size_for
 
-def find_paragraphs_with_font(doc, target_font_size):
-    """Find all paragraphs using the target font size"""
-    candidates = []
+# Every w:sz value (half-points) on a direct run of a body paragraph
+RUN_SIZES_XPATH = etree.XPath(
+    "./w:p/w:r/w:rPr/w:sz/@w:val", namespaces={'w': nsmap['w']}
+)
+
+def index_paragraph_fonts(doc, paragraphs=None):
+    """List (index, text, font sizes) for every non-empty paragraph"""
+    index = []
     
     # Get style fonts
     style_fonts = {}
@@ -15,44 +23,42 @@ def find_paragraphs_with_font(doc, target_font_size):
         except:
             pass
     
-    for i, para in enumerate(doc.paragraphs):
+    # Run font sizes by paragraph (val -> w:sz -> w:rPr -> w:r -> w:p)
+    run_sizes = defaultdict(set)
+    for val in RUN_SIZES_XPATH(doc.element.body):
+        try:
+            run_sizes[val.getparent().getparent().getparent().getparent()].add(float(val) / 2)
+        except:
+            pass
+    
+    style_cache = {}
+    
+    if paragraphs is None:
+        paragraphs = doc.paragraphs
+    
+    for i, para in enumerate(paragraphs):
         text = para.text.strip()
         if not text:
             continue
         
-        has_target_font = False
-        
         # Check style font
-        try:
-            style_name = para.style.name
-            if style_fonts.get(style_name) == target_font_size:
-                has_target_font = True
-        except:
-            pass
-        
-        # Check run fonts
-        if not has_target_font:
-            for run in para.runs:
-                font_size = None
-                try:
-                    if run.font.size:
-                        font_size = run.font.size.pt
-                except:
-                    pass
-                
-                try:
-                    if run.element.rPr is not None:
-                        sz = run.element.rPr.find(qn('w:sz'))
-                        if sz is not None:
-                            font_size = float(sz.get(qn('w:val'))) / 2
-                except:
-                    pass
-                
-                if font_size == target_font_size:
-                    has_target_font = True
-                    break
-        
-        if has_target_font:
+        sizes = set(run_sizes.get(para._p, ()))
+        style_font_size = style_font_size_for(para, style_fonts, style_cache)
+        if style_font_size is not None:
+            sizes.add(style_font_size)
+        index.append((i, text, sizes))
+    
+    return index
+
+def find_paragraphs_with_font(doc, target_font_size, paragraphs=None, font_index=None):
+    """Find all paragraphs using the target font size"""
+    candidates = []
+    
+    if font_index is None:
+        font_index = index_paragraph_fonts(doc, paragraphs)
+    
+    for i, text, sizes in font_index:
+        if target_font_size in sizes:
             candidates.append({
                 'index': i,
                 'text': text,
@@ -1,6 +1,9 @@
 import streamlit as st
 import re
 
+TITLE_STRIP_RE = re.compile(r'[^\w\s-]')
+WHITESPACE_RE = re.compile(r'\s+')
+
 def create_chapter_boundaries(selected_chapters, total_paragraphs):
     """Create chapter boundaries"""
     if not selected_chapters:
@@ -15,8 +18,8 @@ def create_chapter_boundaries(selected_chapters, total_paragraphs):
         end = selected_chapters[i + 1]['index'] - 1 if i + 1 < len(selected_chapters) else total_paragraphs - 1
         
         # Clean title
-        title = re.sub(r'[^\w\s-]', '', chapter['text'])
-        title = re.sub(r'\s+', '_', title)[:40]
+        title = TITLE_STRIP_RE.sub('', chapter['text'])
+        title = WHITESPACE_RE.sub('_', title)[:40]
         if not title:
             title = f"Chapter_{i+1}"
         
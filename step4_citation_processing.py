@@ -1,10 +1,16 @@
 import streamlit as st
 from docx import Document
+from docx.oxml.ns import qn
 from io import BytesIO
+from copy import deepcopy
+from bisect import bisect_right
 import re
 
 # Citation processing functions
 HEADING_RE = re.compile(r"^\s*(notes?|references?|endnotes?|sources?|bibliography|citations?)\s*:?\s*$", re.I)
+CITATION_RE = re.compile(r'\[(\d+)\]')
+# "1. Text", "1) Text", "1] Text", "1 Text" or "1- Text" / "1: Text"
+REF_RE = re.compile(r'^(\d+)(?:[\.\)\]\s]+|[\-–—:]\s*)(.+)$')
 
 def para_iter(doc):
     for p in doc.paragraphs:
@@ -15,104 +21,162 @@ def para_iter(doc):
                 for p in c.paragraphs:
                     yield p
 
-def find_notes_sections(paragraphs):
+def find_notes_sections(texts):
+    """Find (heading, start, end) notes sections in stripped paragraph texts"""
     sections = []
-    for i, p in enumerate(paragraphs):
-        if p.text and HEADING_RE.match(p.text.strip()):
-            start = i + 1
-            end = find_section_end(paragraphs, start)
-            sections.append((i, start, end))
-    return sections
-
-def find_section_end(paragraphs, start):
+    # A section ends at the second consecutive blank after its heading
+    open_heads = []
     consecutive_blanks = 0
-    for i in range(start, len(paragraphs)):
-        text = paragraphs[i].text.strip() if paragraphs[i].text else ""
+    for i, text in enumerate(texts):
         if not text:
             consecutive_blanks += 1
-            if consecutive_blanks >= 2:
-                return i
+            if consecutive_blanks >= 2 and open_heads:
+                sections.extend((head, head + 1, i) for head in open_heads)
+                open_heads = []
         else:
             consecutive_blanks = 0
-    return len(paragraphs)
+            if HEADING_RE.match(text):
+                open_heads.append(i)
+    sections.extend((head, head + 1, len(texts)) for head in open_heads)
+    return sections
 
-def parse_references(paragraphs, start, end):
+def parse_references(texts, start, end):
     refs = {}
     current_num = None
-    current_text = ""
+    current_parts = []
     
     for i in range(start, end):
-        if i >= len(paragraphs):
+        if i >= len(texts):
             break
-        text = paragraphs[i].text.strip() if paragraphs[i].text else ""
+        text = texts[i]
         if not text:
             continue
         
         # Try to match numbered reference
-        patterns = [
-            r'^(\d+)[\.\)\]\s]+(.+)$',
-            r'^(\d+)[\-–—:]\s*(.+)$'
-        ]
-        
-        found_match = False
-        for pattern in patterns:
-            match = re.match(pattern, text)
-            if match:
-                if current_num and current_text:
-                    refs[current_num] = current_text.strip()
-                current_num = int(match.group(1))
-                current_text = match.group(2)
-                found_match = True
-                break
-        
-        if not found_match and current_num:
-            current_text += " " + text
+        match = REF_RE.match(text)
+        if match:
+            if current_num and current_parts:
+                refs[current_num] = " ".join(current_parts).strip()
+            current_num = int(match.group(1))
+            current_parts = [match.group(2)]
+        elif current_num:
+            current_parts.append(text)
     
-    if current_num and current_text:
-        refs[current_num] = current_text.strip()
+    if current_num and current_parts:
+        refs[current_num] = " ".join(current_parts).strip()
     
     return refs
 
-def create_chapter_document(original_doc, start, end):
+def replace_in_runs(paragraph, pattern, repl):
+    """Substitute pattern matches in place, touching only the runs each match spans"""
+    runs = paragraph.runs
+    original_texts = [run.text for run in runs]
+    full_text = "".join(original_texts)
+    
+    edits = []
+    for match in pattern.finditer(full_text):
+        new = repl(match)
+        if new != match.group(0):
+            edits.append((match.start(), match.end(), new))
+    
+    if not edits:
+        return 0
+    
+    # Character offset where each run starts in the joined text
+    starts = []
+    pos = 0
+    for text in original_texts:
+        starts.append(pos)
+        pos += len(text)
+    
+    texts = list(original_texts)
+    
+    # Apply right-to-left so offsets of earlier matches stay valid
+    for s, e, new in reversed(edits):
+        first = bisect_right(starts, s) - 1
+        last = bisect_right(starts, e - 1) - 1
+        if first == last:
+            text = texts[first]
+            texts[first] = text[:s - starts[first]] + new + text[e - starts[first]:]
+        else:
+            # Match spans runs: keep the replacement in the first run's formatting
+            texts[first] = texts[first][:s - starts[first]] + new
+            for k in range(first + 1, last):
+                texts[k] = ""
+            texts[last] = texts[last][e - starts[last]:]
+    
+    for run, old, new in zip(runs, original_texts, texts):
+        if old != new:
+            run.text = new
+    
+    return len(edits)
+
+# References into parts a fresh Document() does not have (footnotes, comments)
+DANGLING_REF_TAGS = (qn('w:footnoteReference'), qn('w:endnoteReference'), qn('w:commentReference'))
+
+def copy_paragraph_element(paragraph, target_part):
+    """Deep-copy a paragraph's XML for target_part, carrying its relationships along"""
+    element = deepcopy(paragraph._element)
+    source_part = paragraph.part
+    
+    # Re-point image/hyperlink/etc. r:id attributes at relationships in the target part
+    for value in element.xpath('.//@r:*'):
+        rel = source_part.rels.get(str(value))
+        if rel is None:
+            continue
+        if rel.is_external:
+            new_rid = target_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        else:
+            new_rid = target_part.relate_to(rel.target_part, rel.reltype)
+        value.getparent().set(value.attrname, new_rid)
+    
+    for ref in element.iter(*DANGLING_REF_TAGS):
+        ref.getparent().remove(ref)
+    
+    return element
+
+def create_chapter_document(original_doc, start, end, paragraphs=None):
     """Create chapter document preserving ALL formatting"""
     new_doc = Document()
     
-    for i in range(start, min(end + 1, len(original_doc.paragraphs))):
-        old_para = original_doc.paragraphs[i]
-        new_para = new_doc.add_paragraph()
-        
-        # Copy paragraph style
-        try:
-            new_para.style = old_para.style
-        except:
-            pass
-        
-        # Copy all runs with exact formatting
-        for run in old_para.runs:
-            new_run = new_para.add_run(run.text)
-            
-            # Copy ALL font properties
-            try:
-                new_run.font.name = run.font.name
-                new_run.font.size = run.font.size
-                new_run.font.bold = run.font.bold
-                new_run.font.italic = run.font.italic
-                new_run.font.underline = run.font.underline
-                if hasattr(run.font, 'color') and run.font.color.rgb:
-                    new_run.font.color.rgb = run.font.color.rgb
-                if hasattr(run.font, 'superscript'):
-                    new_run.font.superscript = run.font.superscript
-                if hasattr(run.font, 'subscript'):
-                    new_run.font.subscript = run.font.subscript
-            except:
-                pass
+    if paragraphs is None:
+        paragraphs = original_doc.paragraphs
+    
+    # Copy paragraphs with all formatting, before the final sectPr
+    sect_pr = new_doc.element.body.sectPr
+    for i in range(start, min(end + 1, len(paragraphs))):
+        sect_pr.addprevious(copy_paragraph_element(paragraphs[i], new_doc.part))
     
     return new_doc
 
+def remove_paragraphs(paragraphs):
+    """Remove paragraphs, deleting each contiguous run of siblings with one slice"""
+    elements = [p._element for p in paragraphs if p._element.getparent() is not None]
+    
+    i = 0
+    while i < len(elements):
+        parent = elements[i].getparent()
+        j = i + 1
+        while j < len(elements) and elements[j].getprevious() is elements[j - 1]:
+            j += 1
+        first = parent.index(elements[i])
+        del parent[first:first + j - i]
+        i = j
+
+def format_reference(num, text, fmt):
+    """Render a reference inline in the chosen citation format"""
+    if fmt.startswith('['):
+        return f" [{num}. {text}]"
+    elif fmt.startswith('—'):
+        return f" — {num}. {text}"
+    return f" ({text})"
+
 def process_chapter_citations(doc, fmt="[1. Reference text]", delete_notes=False):
     """Process citations in a chapter while preserving formatting"""
     paragraphs = list(para_iter(doc))
-    notes_sections = find_notes_sections(paragraphs)
+    # Stripped paragraph texts
+    texts = [p.text.strip() for p in paragraphs]
+    notes_sections = find_notes_sections(texts)
     
     if not notes_sections:
         return 0, 0
@@ -120,59 +184,39 @@ def process_chapter_citations(doc, fmt="[1. Reference text]", delete_notes=False
     # Parse references
     all_refs = {}
     for _, start, end in notes_sections:
-        refs = parse_references(paragraphs, start, end)
+        refs = parse_references(texts, start, end)
         all_refs.update(refs)
     
     if not all_refs:
         return 0, 0
     
+    # Pre-render references
+    formatted_refs = {num: format_reference(num, text, fmt) for num, text in all_refs.items()}
+    
     # Replace citations
     replacements = 0
-    notes_ranges = set()
-    for head, start, end in notes_sections:
-        for i in range(head, end):
-            notes_ranges.add(i)
     
+    # Replace [1], [1] etc.
+    def replace_citation(match):
+        return formatted_refs.get(int(match.group(1)), match.group(0))
+    
+    # Notes section (if any) covering paragraph i
+    section_idx = 0
     for i, para in enumerate(paragraphs):
-        if i not in notes_ranges and para.text:
-            original = para.text
-            modified = original
-            
-            # Replace [1], [1] etc.
-            def replace_citation(match):
-                try:
-                    num = int(match.group(1))
-                    if num in all_refs:
-                        if fmt.startswith('['):
-                            return f" [{num}. {all_refs[num]}]"
-                        elif fmt.startswith('—'):
-                            return f" — {num}. {all_refs[num]}"
-                        else:
-                            return f" ({all_refs[num]})"
-                except:
-                    pass
-                return match.group(0)
-            
-            modified = re.sub(r'\[(\d+)\]', replace_citation, modified)
-            
-            if modified != original:
-                # Update text preserving formatting
-                if para.runs:
-                    para.runs[0].text = modified
-                    for run in para.runs[1:]:
-                        run.text = ""
-                else:
-                    para.add_run(modified)
+        while section_idx < len(notes_sections) and i >= notes_sections[section_idx][2]:
+            section_idx += 1
+        in_notes = section_idx < len(notes_sections) and notes_sections[section_idx][0] <= i
+        
+        # Skip paragraphs without citations
+        if not in_notes and '[' in texts[i]:
+            # Update text preserving formatting of untouched runs
+            if replace_in_runs(para, CITATION_RE, replace_citation):
                 replacements += 1
     
     # Delete notes sections if requested
     if delete_notes:
         for head, start, end in reversed(notes_sections):
-            for idx in range(end - 1, head - 1, -1):
-                if idx < len(paragraphs):
-                    p = paragraphs[idx]
-                    if p._element.getparent() is not None:
-                        p._element.getparent().remove(p._element)
+            remove_paragraphs(paragraphs[head:end])
     
     return len(all_refs), replacements
 
@@ -205,11 +249,13 @@ if __name__ == "__main__":
                 progress = st.progress(0)
                 status = st.empty()
                 
+                paragraphs = doc.paragraphs
+                
                 for i, (start, end, title) in enumerate(boundaries):
                     status.text(f"Processing {i+1}/{len(boundaries)}: {title}")
                     
                     # Create chapter with preserved formatting
-                    chapter_doc = create_chapter_document(doc, start, end)
+                    chapter_doc = create_chapter_document(doc, start, end, paragraphs)
                     
                     # Process citations
                     refs, citations = process_chapter_citations(chapter_doc, fmt, delete_notes)
@@ -1,48 +1,40 @@
 import streamlit as st
 from docx import Document
 from io import BytesIO
+import zipfile
+from step4_citation_processing import copy_paragraph_element
 
 def rejoin_chapters_with_formatting(chapter_docs):
     """Rejoin chapters preserving exact formatting"""
     final_doc = Document()
+    sect_pr = final_doc.element.body.sectPr
     
     for i, chapter_doc in enumerate(chapter_docs):
         # Add page break between chapters (except first)
         if i > 0:
             final_doc.add_page_break()
         
-        # Copy all paragraphs with exact formatting
+        # Copy chapter paragraphs
         for para in chapter_doc.paragraphs:
-            new_para = final_doc.add_paragraph()
-            
-            # Copy paragraph style
-            try:
-                new_para.style = para.style
-            except:
-                pass
-            
-            # Copy all runs with exact formatting
-            for run in para.runs:
-                new_run = new_para.add_run(run.text)
-                
-                # Preserve ALL formatting
-                try:
-                    new_run.font.name = run.font.name
-                    new_run.font.size = run.font.size
-                    new_run.font.bold = run.font.bold
-                    new_run.font.italic = run.font.italic
-                    new_run.font.underline = run.font.underline
-                    if hasattr(run.font, 'color') and run.font.color.rgb:
-                        new_run.font.color.rgb = run.font.color.rgb
-                    if hasattr(run.font, 'superscript'):
-                        new_run.font.superscript = run.font.superscript
-                    if hasattr(run.font, 'subscript'):
-                        new_run.font.subscript = run.font.subscript
-                except:
-                    pass
+            sect_pr.addprevious(copy_paragraph_element(para, final_doc.part))
     
     return final_doc
 
+def serialize_document(doc):
+    """Save a document to DOCX bytes"""
+    bio = BytesIO()
+    doc.save(bio)
+    return bio.getvalue()
+
+def build_chapters_zip(chapter_bytes, boundaries):
+    """Bundle serialized chapter DOCX files into a single ZIP"""
+    bio = BytesIO()
+    # DOCX is already deflated, so store entries instead of compressing again
+    with zipfile.ZipFile(bio, "w", zipfile.ZIP_STORED) as zf:
+        for i, (data, (start, end, title)) in enumerate(zip(chapter_bytes, boundaries)):
+            zf.writestr(f"chapter_{i+1:02d}_{title}.docx", data)
+    return bio.getvalue()
+
 # Only run UI code if this file is run directly
 if __name__ == "__main__":
     st.set_page_config(page_title="Step 5: Rejoin Chapters", page_icon="🔗")
@@ -72,31 +64,36 @@ if __name__ == "__main__":
             with st.spinner("Rejoining chapters with preserved formatting..."):
                 final_doc = rejoin_chapters_with_formatting(chapter_docs)
             
-            # Save to BytesIO
-            bio = BytesIO()
-            final_doc.save(bio)
-            bio.seek(0)
-            
+            # Keep the outputs in session state so download clicks don't hide them
+            processed_data['final_bytes'] = serialize_document(final_doc)
+            processed_data['chapter_bytes'] = [serialize_document(d) for d in chapter_docs]
+            processed_data['chapters_zip'] = build_chapters_zip(processed_data['chapter_bytes'], boundaries)
+        
+        if 'final_bytes' in processed_data:
             st.success("✅ Chapters successfully rejoined with preserved formatting!")
             
             # Download button
             st.download_button(
                 "📥 Download Final Processed Document",
-                data=bio.getvalue(),
+                data=processed_data['final_bytes'],
                 file_name="book_processed_final.docx",
                 mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
             )
             
             # Optional: Download individual chapters
             with st.expander("📁 Download Individual Chapters"):
-                for i, (chapter_doc, (start, end, title)) in enumerate(zip(chapter_docs, boundaries)):
-                    chapter_bio = BytesIO()
-                    chapter_doc.save(chapter_bio)
-                    chapter_bio.seek(0)
-                    
+                st.download_button(
+                    "📦 All Chapters (ZIP)",
+                    data=processed_data['chapters_zip'],
+                    file_name="chapters.zip",
+                    mime="application/zip",
+                    key="ch_zip"
+                )
+                
+                for i, (data, (start, end, title)) in enumerate(zip(processed_data['chapter_bytes'], boundaries)):
                     st.download_button(
                         f"Chapter {i+1:02d}: {title}",
-                        data=chapter_bio.getvalue(),
+                        data=data,
                         file_name=f"chapter_{i+1:02d}_{title}.docx",
                         mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
                         key=f"ch_{i}"